@@ -1,15 +1,34 @@
 import os
+import re
+import atexit
 import json
+import functools
+import asyncio
+import orjson
+import ijson
+from ijson.common import ObjectBuilder
 import requests
 import time
-import traceback
-from typing import List, Dict, Any
+import hashlib
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from types import MappingProxyType
+from dataclasses import asdict, dataclass, field
+from typing import List, Dict, Tuple, Optional, Any
 from dotenv import load_dotenv
-from langchain.agents import AgentExecutor, BaseSingleActionAgent
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from langchain.agents import AgentExecutor, BaseMultiActionAgent
 from langchain_core.agents import AgentAction, AgentFinish
 from langchain.memory import ConversationBufferWindowMemory
 from langchain_community.chat_message_histories import ChatMessageHistory
-from langchain.tools import Tool
+from langchain.tools import Tool, StructuredTool
+from langchain_core.tools import BaseTool
+from pydantic import Field
+
+logger = logging.getLogger(__name__)
 
 # Default fallback values
 CONFIG_DEFAULTS = {
@@ -23,32 +42,53 @@ IS_AZURE = bool(os.getenv("WEBSITE_HOSTNAME") or os.getenv("WEBSITE_SITE_NAME"))
 # Load .env if not in Azure
 if not IS_AZURE:
     dotenv_loaded = load_dotenv(dotenv_path=".env")
-    print("Debug: .env file found and loaded:", dotenv_loaded)
-    print("Debug: Current working directory:", os.getcwd())
-    print("Debug: .env exists at path:", os.path.exists(".env"))
-
-# Load from env vars first
-config = {
-    "default_model": os.getenv("DEFAULT_MODEL", CONFIG_DEFAULTS["default_model"]),
-    "default_mcp_server": os.getenv("DEFAULT_MCP_SERVER", CONFIG_DEFAULTS["default_mcp_server"]),
-    "xai_api_key": os.getenv("XAI_API_KEY")
-}
 
-# Load config.json if not in Azure
-if not IS_AZURE:
-    config_file = "config.json"
-    if os.path.exists(config_file):
-        with open(config_file, 'r') as f:
-            json_config = json.load(f)
-            for key in config.keys():
-                if key in json_config and json_config[key]:
-                    print("Debug: Overwriting", key, "from config.json")
-                    config[key] = json_config[key]
-                else:
-                    print("Debug: Skipping overwrite for", key, "(not present or empty in config.json)")
+# Accept lowercase names like "debug"; an unknown value falls back to the default instead of failing at import
+def resolve_log_level(value, default):
+    level = (value or default).strip().upper()
+    return level if isinstance(logging.getLevelName(level), int) else default
+
+
+# Configure logging after .env so LOG_LEVEL can come from it; Azure defaults to INFO so debug output is never rendered.
+# The level applies to this module only, so urllib3/langchain stay at the root default (WARNING)
+logging.basicConfig(format="%(levelname)s: %(message)s")
+logger.setLevel(resolve_log_level(os.getenv("LOG_LEVEL"), "INFO" if IS_AZURE else "DEBUG"))
+
+# getcwd below is evaluated eagerly, so only run it when DEBUG is enabled; load_dotenv already reports whether .env was found
+if not IS_AZURE and logger.isEnabledFor(logging.DEBUG):
+    logger.debug(".env file found and loaded: %s", dotenv_loaded)
+    logger.debug("Current working directory: %s", os.getcwd())
+
+CONFIG_FILE = "config.json"
+
+# Load settings once (env vars, then config.json overrides outside Azure) into a read-only mapping
+@functools.lru_cache(maxsize=1)
+def load_config():
+    loaded = {
+        "default_model": os.getenv("DEFAULT_MODEL", CONFIG_DEFAULTS["default_model"]),
+        "default_mcp_server": os.getenv("DEFAULT_MCP_SERVER", CONFIG_DEFAULTS["default_mcp_server"]),
+        "xai_api_key": os.getenv("XAI_API_KEY")
+    }
+    # config.json is parsed a single time; the prompts are needed even in Azure, where the scalar overrides are skipped
+    try:
+        with open(CONFIG_FILE, 'rb') as f:
+            json_config = orjson.loads(f.read())
+    except FileNotFoundError:
+        json_config = {}
+    if not IS_AZURE:
+        for key, value in json_config.items():
+            if key in loaded and value:
+                logger.debug("Overwriting %s from config.json", key)
+                loaded[key] = value
+    # Prompt templates are joined here so agent creation does not rebuild them
+    loaded["instruction"] = "\n".join(json_config.get("orchestrator_prompts", []))
+    loaded["formatter_prompt"] = "\n".join(json_config.get("formatter_prompts", []))
+    return MappingProxyType(loaded)
+
+config = load_config()
 
 # Print masked API key for debugging
-print("Debug: Final loaded XAI_API_KEY (masked):", "****" if config["xai_api_key"] else "None")
+logger.debug("Final loaded XAI_API_KEY (masked): %s", "****" if config["xai_api_key"] else "None")
 
 # Check for required API key
 if not config.get("xai_api_key"):
@@ -57,239 +97,949 @@ if not config.get("xai_api_key"):
 # Set XAI_API_KEY in environment
 os.environ["XAI_API_KEY"] = config["xai_api_key"]
 
-# Send MCP request with retries
-def send_mcp_request(method, params=None, server_url=None):
+# Retry backoff: min(cap, base * 2**attempt) plus random jitter, so transient failures cost ~100-400ms
+# and concurrent clients do not retry in lockstep; urllib3 never sleeps after the final attempt
+_BACKOFF_BASE = 0.1
+_BACKOFF_CAP = 2.0
+_BACKOFF_JITTER = 0.1
+
+# urllib3 sleeps for the full Retry-After and ignores backoff_max, so a "Retry-After: 60" would stall a turn;
+# the server's hint is still honoured, but never for longer than the session's backoff cap
+class CappedRetry(Retry):
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, self.backoff_max)
+
+# Pooled HTTP sessions so keep-alive reuses sockets; retries/backoff are handled by urllib3
+def create_pooled_session(schemes, headers=None, **retry_options):
+    # total counts retries, so 2 bounds each request to 3 attempts
+    options = {
+        "total": 2,
+        "backoff_factor": _BACKOFF_BASE,
+        "backoff_max": _BACKOFF_CAP,
+        "backoff_jitter": _BACKOFF_JITTER,
+        "status_forcelist": [429, 500, 502, 503, 504],
+        "allowed_methods": frozenset(["POST"]),
+        # Hand back the last response once retries are exhausted so callers log its status and body
+        "raise_on_status": False
+    }
+    options.update(retry_options)
+    retry = CappedRetry(**options)
+    session = requests.Session()
+    # Static headers are set once on the session instead of being rebuilt per call
+    session.headers.update({"Content-Type": "application/json", "Accept": "application/json"})
+    session.headers.update(headers or {})
+    for scheme in schemes:
+        session.mount(scheme, HTTPAdapter(pool_connections=4, pool_maxsize=32, max_retries=retry))
+    atexit.register(session.close)
+    return session
+
+# Streamable HTTP MCP servers may answer with a single-event SSE stream instead of plain JSON
+MCP_HEADERS = {"Accept": "application/json, text/event-stream"}
+# list/read methods are idempotent, so they get the full retry policy (timeouts, dropped connections, 429/5xx)
+_mcp_session = create_pooled_session(["http://", "https://"], headers=MCP_HEADERS)
+# tools/call may have side effects, and a read timeout or even a 504 can come back after the call ran,
+# so only connection failures (the request never reached the server) are retried, never on status
+NON_IDEMPOTENT_MCP_METHODS = frozenset(["tools/call"])
+_mcp_call_session = create_pooled_session(["http://", "https://"], headers=MCP_HEADERS, read=0, other=0, status=0, status_forcelist=[])
+
+def _mcp_session_for(methods):
+    return _mcp_call_session if NON_IDEMPOTENT_MCP_METHODS.intersection(methods) else _mcp_session
+# Grok backoff is capped and jittered so a stuck upstream does not block a turn for long
+_grok_session = create_pooled_session(["https://"], headers={"Authorization": f"Bearer {config['xai_api_key']}"}, backoff_factor=0.25, backoff_max=4.0)
+
+# Grok 3 request bounds; a read timeout just above typical latency cancels tail outliers early
+TIMEOUTS = {"connect": 3.0, "read": float(os.getenv("GROK_READ_TIMEOUT", "15"))}
+FORMATTER_MAX_TOKENS = 512
+# The planner may also return formatted_output for list-only queries, so it needs the formatter budget too
+PLANNER_MAX_TOKENS = 256 + FORMATTER_MAX_TOKENS
+
+# In-process LRU+TTL cache for deterministic (temperature 0) Grok 3 responses
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "300"))
+
+class LLMCache:
+    def __init__(self, maxsize=128, ttl=LLM_CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(payload):
+        key_fields = {field: payload[field] for field in ("model", "messages", "temperature", "max_tokens", "response_format")}
+        return hashlib.sha256(orjson.dumps(key_fields, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+_llm_cache = LLMCache()
+
+# Circuit breaker: after repeated failures, fail fast for a cooldown, then let a single probe through
+@dataclass
+class CircuitBreaker:
+    name: str
+    failure_threshold: int = 5
+    cooldown: float = 60.0
+    state: str = "closed"
+    fail_count: int = 0
+    opened_at: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def allow(self):
+        with self.lock:
+            if self.state == "closed":
+                return True
+            if time.monotonic() - self.opened_at < self.cooldown:
+                return False
+            # Cooldown elapsed (or a previous probe never reported back): this caller becomes the probe
+            if self.state == "open":
+                logger.info("%s circuit half-open, probing", self.name)
+            self.state = "half_open"
+            self.opened_at = time.monotonic()
+            return True
+
+    def record_success(self):
+        with self.lock:
+            if self.state != "closed":
+                logger.info("%s circuit closed", self.name)
+            self.state = "closed"
+            self.fail_count = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.fail_count += 1
+            if self.state == "half_open" or (self.state == "closed" and self.fail_count >= self.failure_threshold):
+                logger.warning("%s circuit open after %d consecutive failures", self.name, self.fail_count)
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+_mcp_breaker = CircuitBreaker("MCP")
+_grok_breaker = CircuitBreaker("Grok 3")
+
+# A JSON-RPC reply carries an id and a result or error; notifications and server requests carry a method instead
+def is_mcp_reply(message):
+    return isinstance(message, dict) and "method" not in message and "id" in message and ("result" in message or "error" in message)
+
+def is_event_stream(response):
+    return response.headers.get("Content-Type", "").startswith("text/event-stream")
+
+# SSE: only data lines carry JSON-RPC messages; event/id/comment lines are skipped as raw bytes
+def iter_sse_messages(response):
+    for raw in response.iter_lines():
+        if raw.startswith(b"data:"):
+            yield orjson.loads(raw[5:].lstrip())
+
+# Decode a JSON-RPC response body; the transport is detected once from Content-Type.
+# Over SSE the server may send notifications or requests (progress, logging) before the reply, so those are
+# skipped and reading stops at the reply to request_id; None means the stream ended without one
+def parse_mcp_response(response, request_id=1):
+    if not is_event_stream(response):
+        return orjson.loads(response.content)
+    for message in iter_sse_messages(response):
+        if is_mcp_reply(message) and message["id"] == request_id:
+            return message
+    return None
+
+# List responses above this size are streamed with ijson so only the result array is materialized.
+# Content-Length is the on-the-wire size, so for compressed replies this compares the compressed payload;
+# it is only a heuristic for "large", and either parse path yields the same result
+STREAM_LIST_THRESHOLD = 64 * 1024
+
+# Stream result.<kind> items out of a JSON-RPC list reply; an error envelope or a body without result
+# is a failure ({}), the same as on the buffered path
+def stream_mcp_list(response, method):
+    kind = method.split("/")[0]
+    item_prefix = f"result.{kind}.item"
+    response.raw.decode_content = True
+    items = []
+    top_level_keys = set()
+    builder = None
+    for prefix, event, value in ijson.parse(response.raw, use_float=True):
+        if builder is not None:
+            builder.event(event, value)
+            if prefix == item_prefix and event in ("end_map", "end_array"):
+                items.append(builder.value)
+                builder = None
+        elif prefix == item_prefix:
+            if event in ("start_map", "start_array"):
+                builder = ObjectBuilder()
+                builder.event(event, value)
+            else:
+                items.append(value)
+        elif prefix == "" and event == "map_key":
+            top_level_keys.add(value)
+    if "error" in top_level_keys or "result" not in top_level_keys:
+        logger.debug("No result in streamed %s response", method)
+        return {}
+    return {kind: items}
+
+# Resolve the MCP endpoint, defaulting to the configured server
+def _mcp_url(server_url=None):
     if not server_url:
         server_url = config["default_mcp_server"]
     if not server_url.endswith('/'):
         server_url += '/'
-    headers = {"Content-Type": "application/json", "Accept": "application/json"}
+    return server_url
+
+# Send MCP request with retries
+def send_mcp_request(method, params=None, server_url=None):
+    server_url = _mcp_url(server_url)
     payload = {"jsonrpc": "2.0", "method": method, "params": params or {}, "id": 1}
-    print(f"Debug: Sending {method} request to {server_url} with payload:", json.dumps(payload, indent=2))
-    max_attempts = 3
-    for attempt in range(max_attempts):
-        try:
-            response = requests.post(server_url, headers=headers, json=payload, timeout=5)
+    logger.debug("Sending %s request to %s with payload: %s", method, server_url, payload)
+    if not _mcp_breaker.allow():
+        logger.debug("MCP circuit open, failing %s fast", method)
+        return {}
+    is_list = method.endswith("/list")
+    try:
+        with _mcp_session_for([method]).post(server_url, data=orjson.dumps(payload), timeout=5, stream=True) as response:
             if response.status_code == 200:
-                result = response.json().get("result", {})
-                print(f"Debug: Successful {method} response:", json.dumps(result, indent=2))
+                if (is_list and response.headers.get("Content-Type", "").startswith("application/json")
+                        and int(response.headers.get("Content-Length") or 0) > STREAM_LIST_THRESHOLD):
+                    result = stream_mcp_list(response, method)
+                else:
+                    message = parse_mcp_response(response, payload["id"])
+                    if message is None:
+                        raise ValueError("event stream ended without a reply")
+                    result = message.get("result", {})
+                _mcp_breaker.record_success()
+                logger.debug("Successful %s response: %s", method, result)
                 return result
-            else:
-                print(f"Debug: Failed {method} request on attempt {attempt + 1}: {response.status_code} - {response.text}")
-        except Exception as e:
-            print(f"Debug: Error on {method} request attempt {attempt + 1}: {str(e)}")
-        time.sleep(1)  # Delay between retries
-    print(f"Debug: Failed to retrieve {method} after {max_attempts} attempts")
+            logger.debug("Failed %s request: %s - %s", method, response.status_code, response.text)
+    except Exception as e:
+        logger.debug("Error on %s request: %s", method, e)
+    _mcp_breaker.record_failure()
+    logger.debug("Failed to retrieve %s after retries", method)
     return {}
 
+# Collect the replies to a batch keyed by id, from a JSON array body or from SSE events that each carry
+# a single reply or an array; notifications in between are skipped
+def collect_batch_replies(response, expected_ids):
+    messages = iter_sse_messages(response) if is_event_stream(response) else [orjson.loads(response.content)]
+    replies = {}
+    for message in messages:
+        for reply in message if isinstance(message, list) else [message]:
+            if is_mcp_reply(reply) and reply["id"] in expected_ids:
+                replies[reply["id"]] = reply
+        if len(replies) == len(expected_ids):
+            break
+    return replies
+
+# Send several independent MCP calls as one JSON-RPC batch POST; returns results in call order. Returns None,
+# so callers fall back to single requests, only when the server provably did not run the batch: a
+# "batch unsupported" status, or a 200 with no recognisable replies to a batch of idempotent methods.
+# After a 200, tools/call is never re-sent; a call without a reply gets the failed ({}) result
+def send_mcp_batch(calls, server_url=None):
+    server_url = _mcp_url(server_url)
+    payload = [{"jsonrpc": "2.0", "method": method, "params": params or {}, "id": i} for i, (method, params) in enumerate(calls)]
+    logger.debug("Sending batch of %d requests to %s", len(payload), server_url)
+    if not _mcp_breaker.allow():
+        logger.debug("MCP circuit open, failing batch fast")
+        return [{} for _ in calls]
+    methods = [method for method, _ in calls]
+    try:
+        with _mcp_session_for(methods).post(server_url, data=orjson.dumps(payload), timeout=5, stream=True) as response:
+            if response.status_code == 200:
+                replies = collect_batch_replies(response, set(range(len(calls))))
+                if not replies and not NON_IDEMPOTENT_MCP_METHODS.intersection(methods):
+                    logger.debug("Server did not return a batch response")
+                    return None
+                _mcp_breaker.record_success()
+                if len(replies) < len(calls):
+                    logger.debug("Batch reply is missing %d of %d responses", len(calls) - len(replies), len(calls))
+                return [replies[i].get("result", {}) if i in replies else {} for i in range(len(calls))]
+            logger.debug("Failed batch request: %s - %s", response.status_code, response.text)
+            # Servers without batch support typically reject the array outright
+            if response.status_code in (400, 404, 415, 422):
+                return None
+    except Exception as e:
+        logger.debug("Error on batch request: %s", e)
+    _mcp_breaker.record_failure()
+    return [{} for _ in calls]
+
+# First choice of a chat completion body, or an empty dict when the body does not have that shape
+def _first_choice(body):
+    choices = body.get("choices") if isinstance(body, dict) else None
+    choice = choices[0] if isinstance(choices, list) and choices else None
+    return choice if isinstance(choice, dict) else {}
+
+# Accumulate the streamed choices[0].delta.content chunks until the [DONE] marker
+def read_grok_stream(response):
+    chunks = []
+    for raw in response.iter_lines():
+        if not raw.startswith(b"data:"):
+            continue
+        data = raw[5:].strip()
+        if data == b"[DONE]":
+            break
+        # A malformed chunk is skipped rather than aborting the whole completion
+        try:
+            delta = _first_choice(orjson.loads(data)).get("delta")
+        except orjson.JSONDecodeError:
+            logger.debug("Skipping malformed Grok 3 stream chunk: %r", data)
+            continue
+        piece = delta.get("content") if isinstance(delta, dict) else None
+        if isinstance(piece, str) and piece:
+            chunks.append(piece)
+    return "".join(chunks) or "{}"
+
 # Call Grok 3 API for semantic matching
-def call_grok_3(prompt, max_retries=3):
-    headers = {
-        "Authorization": f"Bearer {config['xai_api_key']}",
-        "Content-Type": "application/json",
-        "Accept": "application/json"
-    }
+def call_grok_3(prompt, temperature=0.7, max_tokens=PLANNER_MAX_TOKENS):
     payload = {
         "model": config["default_model"],
         "messages": [{"role": "system", "content": prompt}],
-        "temperature": 0.7,
-        "max_tokens": 512,
+        "temperature": temperature,
+        "max_tokens": max_tokens,
         "top_p": 1.0,
         "frequency_penalty": 0.0,
         "presence_penalty": 0.0,
-        "response_format": {"type": "json_object"}
+        "response_format": {"type": "json_object"},
+        "stream": True
     }
-    print("Debug: Using API key (masked):", "****" if config['xai_api_key'] else "None", "for model:", payload["model"])
-    print("Debug: API request headers:", headers)
-    print("Debug: API request URL:", "https://api.x.ai/v1/chat/completions")
-    print("Debug: Sending Grok API request with payload:", json.dumps(payload, indent=2))
-    for attempt in range(max_retries):
-        try:
-            response = requests.post("https://api.x.ai/v1/chat/completions", headers=headers, json=payload, timeout=10)
+    logger.debug("Using API key (masked): %s for model: %s", "****" if config['xai_api_key'] else "None", payload["model"])
+    logger.debug("API request URL: %s", "https://api.x.ai/v1/chat/completions")
+    logger.debug("Sending Grok API request with payload: %s", payload)
+    # Only deterministic calls are safe to serve from cache
+    cache_key = LLMCache.make_key(payload) if temperature == 0 else None
+    if cache_key:
+        cached = _llm_cache.get(cache_key)
+        if cached is not None:
+            logger.debug("Grok 3 cache hit")
+            return cached
+    if not _grok_breaker.allow():
+        logger.debug("Grok 3 circuit open, failing fast")
+        return {"action": "error", "message": "Grok 3 is temporarily unavailable"}
+    try:
+        with _grok_session.post("https://api.x.ai/v1/chat/completions", data=orjson.dumps(payload), timeout=(TIMEOUTS["connect"], TIMEOUTS["read"]), stream=True) as response:
             if response.status_code == 200:
-                result = response.json().get("choices", [{}])[0].get("message", {}).get("content", "{}")
-                print("Debug: Grok 3 response:", result)
+                # Fall back to the buffered body if the API answered without SSE framing
+                if response.headers.get("Content-Type", "").startswith("text/event-stream"):
+                    result = read_grok_stream(response)
+                else:
+                    message = _first_choice(orjson.loads(response.content)).get("message")
+                    result = (message.get("content") if isinstance(message, dict) else None) or "{}"
+                _grok_breaker.record_success()
+                logger.debug("Grok 3 response: %s", result)
                 try:
-                    return json.loads(result)
-                except json.JSONDecodeError as e:
-                    print(f"Debug: Invalid JSON in Grok 3 response: {str(e)}")
+                    parsed = orjson.loads(result)
+                except orjson.JSONDecodeError as e:
+                    logger.debug("Invalid JSON in Grok 3 response: %s", e)
                     return {"action": "error", "message": "Invalid JSON response from Grok 3"}
-            else:
-                print(f"Debug: Failed Grok 3 request on attempt {attempt + 1}: {response.status_code} - {response.text}")
-        except Exception as e:
-            print(f"Debug: Error on Grok 3 request attempt {attempt + 1}: {str(e)}")
-        time.sleep(2 ** attempt)  # Exponential backoff
-    print("Debug: Failed to retrieve Grok 3 response after retries")
+                if cache_key:
+                    _llm_cache.set(cache_key, parsed)
+                return parsed
+            logger.debug("Failed Grok 3 request: %s - %s", response.status_code, response.text)
+    # Anything unexpected in the body must still reach record_failure, or a half-open probe is never resolved
+    except (requests.RequestException, orjson.JSONDecodeError, KeyError, IndexError, TypeError, AttributeError) as e:
+        logger.debug("Error on Grok 3 request: %s", e)
+    _grok_breaker.record_failure()
+    logger.debug("Failed to retrieve Grok 3 response after retries")
     return {"action": "error", "message": "Failed to process prompt"}
 
-# Custom agent for MCP tool invocation with Grok 3
-class ExecutorAgent(BaseSingleActionAgent):
-    tools: List[Tool]
+# Process-wide pool for blocking MCP/Grok I/O, shared by every event loop (main, background refresh)
+# instead of each asyncio.run() spinning up its own default executor
+_EXEC = ThreadPoolExecutor(max_workers=int(os.getenv("MCP_WORKERS", "8")), thread_name_prefix="mcp-io")
+atexit.register(_EXEC.shutdown, wait=False)
+
+async def _run_io(func, *args):
+    return await asyncio.get_running_loop().run_in_executor(_EXEC, functools.partial(func, *args))
+
+# Async wrappers that run the pooled blocking calls off the event loop so independent requests overlap
+async def _send_mcp_async(method, params=None, server_url=None):
+    return await _run_io(send_mcp_request, method, params, server_url)
+
+async def _call_grok_async(prompt, temperature=0.7, max_tokens=PLANNER_MAX_TOKENS):
+    return await _run_io(call_grok_3, prompt, temperature, max_tokens)
+
+# Read several MCP resources in one batch POST, falling back to concurrent single reads; preserves input order
+async def read_mcp_resources(resource_uris):
+    calls = [("resources/read", {"uri": uri}) for uri in resource_uris]
+    if len(calls) > 1:
+        results = await _run_io(send_mcp_batch, calls)
+        if results is not None:
+            return results
+    return await asyncio.gather(*(_send_mcp_async(method, params) for method, params in calls))
+
+# One planner action, validated once per Grok 3 response instead of re-walking dicts in plan()
+@dataclass(frozen=True, slots=True)
+class PlannedAction:
+    action: Optional[str] = None
+    type: Optional[str] = None
+    tool_name: Optional[str] = None
+    tool_input: Any = field(default_factory=dict)
+    resource_uri: str = ""
+    message: str = ""
+
+    @classmethod
+    def from_dict(cls, item):
+        if not isinstance(item, dict):
+            return cls()
+        return cls(
+            action=item.get("action"),
+            type=item.get("type"),
+            tool_name=item.get("tool_name"),
+            tool_input=item.get("tool_input", {}),
+            resource_uri=item.get("resource_uri") or "",
+            message=item.get("message") or ""
+        )
+
+# Accept both the {actions: [...]} and single-action response shapes
+def parse_planned_actions(grok_response):
+    raw_actions = grok_response.get("actions", []) if "actions" in grok_response else [grok_response]
+    if not isinstance(raw_actions, list):
+        raw_actions = []
+    return [PlannedAction.from_dict(item) for item in raw_actions]
+
+# Placeholder strings plan() emits when there is no data; these never need an LLM formatting pass
+_EMPTY_NOTICES = frozenset(["No tools available", "No resources available", "No prompts available"])
+
+def needs_formatting(combined_output):
+    return any(not isinstance(item, str) or not (item.startswith("Error: ") or item in _EMPTY_NOTICES) for item in combined_output)
+
+# Compact JSON text for prompts and agent output, via orjson
+def to_json(value):
+    return orjson.dumps(value).decode()
+
+# Check that a Grok 3 formatter payload has the structured tools/resources shape
+def is_formatted_response(response):
+    return isinstance(response, dict) and "tools" in response and "resources" in response
+
+# Pure listing queries ("list tools", "What are the Tools available?", "show tools and resources") are answered
+# locally from discovered primitives; anything else, including ambiguous phrasings, still goes to Grok 3
+LIST_SHORTCUT = os.getenv("LIST_SHORTCUT", "true").lower() != "false"
+_LIST_KINDS = r"(?:tools?|resources?|prompts?)"
+_LIST_QUERY_RE = re.compile(
+    rf"(?:(?:can|could) you\s+)?(?:please\s+)?(?:list|show(?: me)?|what are)(?: all)?(?: the)?(?: available)?\s+"
+    rf"(?P<kinds>{_LIST_KINDS}(?:\s*(?:,|and|&)\s*{_LIST_KINDS})*)(?: (?:are )?available)?\s*[?.!]?",
+    re.IGNORECASE
+)
+_LIST_KIND_RE = re.compile(r"tool|resource|prompt", re.IGNORECASE)
+
+# Return the requested list types ("tools", "resources", "prompts") for a pure listing query, else None
+def match_list_query(query):
+    match = _LIST_QUERY_RE.fullmatch(query.strip())
+    if not match:
+        return None
+    return {kind.lower() + "s" for kind in _LIST_KIND_RE.findall(match.group("kinds"))}
+
+# Window memory that memoizes the rendered history until the conversation changes
+class CachedBufferWindowMemory(ConversationBufferWindowMemory):
+    rendered_buffer: str = ""
+    buffer_dirty: bool = True
+
+    def save_context(self, inputs, outputs):
+        super().save_context(inputs, outputs)
+        self.buffer_dirty = True
+
+    async def asave_context(self, inputs, outputs):
+        await super().asave_context(inputs, outputs)
+        self.buffer_dirty = True
+
+    def clear(self):
+        super().clear()
+        self.buffer_dirty = True
+
+    async def aclear(self):
+        await super().aclear()
+        self.buffer_dirty = True
+
+    @property
+    def cached_buffer(self):
+        if self.buffer_dirty:
+            self.rendered_buffer = self.buffer_as_str
+            self.buffer_dirty = False
+        return self.rendered_buffer
+
+# Tool action that also carries the planner's non-tool output (list lines, resource reads) to the formatting step
+class MCPToolAction(AgentAction):
+    carried_output: List[Any] = Field(default_factory=list)
+
+# Custom agent for MCP tool invocation with Grok 3; every tool the planner selects is returned in one step
+# so AgentExecutor runs them concurrently instead of one planner round trip per tool
+class ExecutorAgent(BaseMultiActionAgent):
+    # BaseTool, since planner tools such as batch_tool are StructuredTools rather than Tools
+    tools: List[BaseTool]
+    planner_tools: List[BaseTool] = Field(default_factory=list)
     instruction: str
     formatter_prompt: str
-    memory: ConversationBufferWindowMemory
-    resources_list: List[str]
-    prompts_list: List[str]
+    memory: CachedBufferWindowMemory
+    # Structured {uri|name, description} entries; display strings are rendered from them, never parsed back
+    resources_list: Tuple[Dict[str, str], ...]
+    prompts_list: Tuple[Dict[str, str], ...]
+    tools_block: str = ""
+    tool_names: str = ""
+    tool_lines: Tuple[str, ...] = ()
+    resources_block: str = ""
+    prompts_block: str = ""
+    tool_by_name: Dict[str, BaseTool] = {}
+    list_outputs: Dict[str, Tuple[str, ...]] = {}
+    static_prefix: str = ""
 
-    def __init__(self, tools: List[Tool], instruction: str, formatter_prompt: str, memory: ConversationBufferWindowMemory, resources_list: List[str], prompts_list: List[str]):
-        super().__init__(tools=tools, instruction=instruction, formatter_prompt=formatter_prompt, memory=memory, resources_list=resources_list, prompts_list=prompts_list)
+    # tools are the ones discovered on the MCP server and shown in listings; planner_tools (e.g. batch_tool)
+    # are client-side helpers the planner may call but that are never listed as server tools
+    def __init__(self, tools: List[BaseTool], instruction: str, formatter_prompt: str, memory: CachedBufferWindowMemory, resources_list: Tuple[Dict[str, str], ...], prompts_list: Tuple[Dict[str, str], ...], planner_tools: Optional[List[BaseTool]] = None):
+        planner_tools = planner_tools or []
+        super().__init__(tools=tools, instruction=instruction, formatter_prompt=formatter_prompt, memory=memory, resources_list=resources_list, prompts_list=prompts_list, planner_tools=planner_tools)
         self.tools = tools
+        self.planner_tools = planner_tools
         self.instruction = instruction
         self.formatter_prompt = formatter_prompt
         self.memory = memory
         self.resources_list = resources_list
         self.prompts_list = prompts_list
+        # Tools/resources/prompts are fixed for the executor's lifetime, so render them once,
+        # reading each tool's attributes a single time for all three renderings
+        callable_tools = tools + planner_tools
+        names = [t.name for t in callable_tools]
+        descriptions = [t.description for t in callable_tools]
+        self.tools_block = ', '.join(map('Name: {}, Description: {}'.format, names, descriptions)) if tools else 'No tools available.'
+        self.tool_names = ', '.join(names) if tools else 'None'
+        # User-facing listings cover the discovered server tools only
+        self.tool_lines = tuple(map('{}: {}'.format, names[:len(tools)], descriptions[:len(tools)])) if tools else ("No tools available",)
+        resource_lines = tuple(map('{uri}: {description}'.format_map, resources_list))
+        prompt_lines = tuple(map('{name}: {description}'.format_map, prompts_list))
+        self.resources_block = ', '.join(resource_lines) if resource_lines else 'No resources available.'
+        self.prompts_block = ', '.join(prompt_lines) if prompt_lines else 'No prompts available.'
+        self.tool_by_name = dict(zip(names, callable_tools))
+        # Dispatch table for 'list' actions, keyed by the planner's type field
+        self.list_outputs = {
+            "tools": self.tool_lines,
+            "resources": resource_lines or ("No resources available",),
+            "prompts": prompt_lines or ("No prompts available",)
+        }
+        # Static part of the planner prompt, kept byte-identical across calls so provider prefix caching can hit
+        self.static_prefix = f"{instruction}\nTools: {self.tools_block}\nResources: {self.resources_block}\nPrompts: {self.prompts_block}\nTool names: {self.tool_names}"
 
     @property
     def input_keys(self):
         return ["input"]
 
+    # Sync entry point for AgentExecutor.invoke; the planning logic lives in aplan
     def plan(self, intermediate_steps, **kwargs):
+        return asyncio.run(self.aplan(intermediate_steps, **kwargs))
+
+    async def aplan(self, intermediate_steps, **kwargs):
+        # The agent plans once per turn: every tool the planner picked already ran in the single previous step,
+        # so merge their observations with the carried output and finish. Dependent tool chains are not re-planned
+        if intermediate_steps:
+            first_action = intermediate_steps[0][0]
+            combined_output = list(getattr(first_action, "carried_output", []))
+            combined_output.extend(observation for _, observation in intermediate_steps)
+            return await self._complete(combined_output)
         query = kwargs.get("input", "")
-        print("Debug: Available tools:", [t.name for t in self.tools])
-        print("Debug: Tool descriptions:", {t.name: t.description for t in self.tools})
-        print("Debug: Tool selection intent:", "list tools" if "list tools" in query.lower() or "what are the tools" in query.lower() else "other")
-        print("Debug: Raw instruction string:", repr(self.instruction))
-        print("Debug: Raw formatter prompt:", repr(self.formatter_prompt))
-        print("Debug: Conversation history:", self.memory.buffer_as_str)
+        if LIST_SHORTCUT:
+            kinds = match_list_query(query)
+            if kinds:
+                return self._list_answer(kinds)
+        prompt = self._build_prompt(query)
+        if isinstance(prompt, AgentFinish):
+            return prompt
+        return await self._dispatch(await _call_grok_async(prompt))
+
+    # Finish with the combined output, formatting it through Grok 3 only when it carries real data
+    async def _complete(self, combined_output):
+        if not combined_output:
+            return AgentFinish(return_values={"output": "No relevant tool or action found"}, log="Executor: No action taken")
+        if not needs_formatting(combined_output):
+            logger.debug("Only errors/empty notices in combined output, skipping formatter call")
+            return AgentFinish(return_values={"output": to_json(combined_output)}, log="Executor: Returning unformatted results")
+        # The formatter only reshapes data, so run it deterministically to make it cacheable
+        return self._finish(combined_output, await _call_grok_async(self._formatter_input(combined_output), temperature=0, max_tokens=FORMATTER_MAX_TOKENS))
+
+    # Answer a listing query in the formatter's {tools, resources} shape without a Grok 3 round trip
+    def _list_answer(self, kinds):
+        logger.debug("List query for %s answered locally", sorted(kinds))
+        formatted = {
+            "tools": [{"name": t.name, "description": t.description} for t in self.tools] if "tools" in kinds else [],
+            "resources": list(self.resources_list) if "resources" in kinds else []
+        }
+        if "prompts" in kinds:
+            formatted["prompts"] = list(self.prompts_list)
+        return AgentFinish(return_values={"output": to_json(formatted)}, log="Executor: Returning locally listed primitives")
+
+    # Build the planner prompt, or an AgentFinish if templating fails
+    def _build_prompt(self, query):
+        logger.debug("Available tools: %s", self.tool_names)
+        logger.debug("Tool descriptions: %s", self.tools_block)
+        # The intent heuristic is evaluated eagerly, so only compute it when DEBUG logging is enabled
+        if logger.isEnabledFor(logging.DEBUG):
+            kinds = match_list_query(query)
+            logger.debug("Tool selection intent: %s", f"list {', '.join(sorted(kinds))}" if kinds else "other")
+        logger.debug("Raw instruction string: %r", self.instruction)
+        logger.debug("Raw formatter prompt: %r", self.formatter_prompt)
         try:
-            prompt = f"{self.instruction}\nTools: {', '.join(f'Name: {t.name}, Description: {t.description}' for t in self.tools) if self.tools else 'No tools available.'}\nResources: {', '.join(self.resources_list) if self.resources_list else 'No resources available.'}\nPrompts: {', '.join(self.prompts_list) if self.prompts_list else 'No prompts available.'}\nPrevious conversation: {self.memory.buffer_as_str}\nQuery: {query}\nTool names: {', '.join(t.name for t in self.tools) if self.tools else 'None'}\nAgent scratchpad: "
-            print("Debug: Raw formatted prompt:", repr(prompt))
+            history = self.memory.cached_buffer
+            # Dynamic content (history, query) goes last so the static prefix stays cacheable
+            prompt = f"{self.static_prefix}\nPrevious conversation: {history}\nQuery: {query}\nAgent scratchpad: "
         except Exception as e:
-            print(f"Debug: Template formatting error: {str(e)}")
+            logger.debug("Template formatting error: %s", e)
             return AgentFinish(return_values={"output": f"Error: Invalid template processing {str(e)}"}, log=f"Executor: Template formatting error: {str(e)}")
-        print("Debug: Full Grok 3 prompt sent:", prompt)
-        grok_response = call_grok_3(prompt)
-        print("Debug: Full Grok 3 response:", json.dumps(grok_response, indent=2))
-        print("Debug: Processing action:", grok_response.get("action"))
-        
+        logger.debug("Conversation history: %s", history)
+        logger.debug("Full Grok 3 prompt sent: %s", prompt)
+        return prompt
+
+    # Map the planner response to the tool actions to run, or a finished AgentFinish
+    async def _dispatch(self, grok_response):
+        logger.debug("Full Grok 3 response: %s", grok_response)
+
         # Validate grok_response
         if not isinstance(grok_response, dict):
-            print("Debug: Invalid grok_response type:", type(grok_response))
+            logger.debug("Invalid grok_response type: %s", type(grok_response))
             return AgentFinish(return_values={"output": "Error: Invalid response from Grok 3"}, log="Executor: Invalid Grok 3 response")
         
         if grok_response.get("action") == "error":
             return AgentFinish(return_values={"output": grok_response.get("message", "Query processing failed")}, log="Executor: Error from Grok 3")
         
-        actions = grok_response.get("actions", []) if "actions" in grok_response else [{"action": grok_response.get("action"), "type": grok_response.get("type"), "tool_name": grok_response.get("tool_name"), "tool_input": grok_response.get("tool_input", {}), "resource_uri": grok_response.get("resource_uri", ""), "message": grok_response.get("message", "")}]
-        print("Debug: Processing actions:", actions)
+        actions = parse_planned_actions(grok_response)
+        logger.debug("Processing actions: %s", actions)
         combined_output = []
-        
+        tool_calls = []
+        # Resource reads are deferred and fetched together; record their slot in combined_output to keep ordering
+        pending_reads = []
+
         for action_item in actions:
-            action = action_item.get("action")
+            action = action_item.action
             if action == "list":
-                action_type = action_item.get("type")
-                print("Debug: Handling list action with type:", action_type)
-                if action_type == "tools":
-                    if not self.tools:
-                        combined_output.append("No tools available")
-                    else:
-                        combined_output.extend([f"{t.name}: {t.description}" for t in self.tools])
-                elif action_type == "resources":
-                    combined_output.extend(self.resources_list if self.resources_list else ["No resources available"])
-                elif action_type == "prompts":
-                    combined_output.extend(self.prompts_list if self.prompts_list else ["No prompts available"])
-                else:
+                action_type = action_item.type
+                logger.debug("Handling list action with type: %s", action_type)
+                lines = self.list_outputs.get(action_type)
+                if lines is None:
                     combined_output.append(f"Error: Invalid list type {action_type}")
+                else:
+                    combined_output.extend(lines)
             elif action == "tool":
-                tool_name = action_item.get("tool_name")
-                tool_input = action_item.get("tool_input", {})
-                print("Debug: Tool selection details - tool_name:", tool_name, "tool_input:", json.dumps(tool_input, indent=2))
-                for tool in self.tools:
-                    if tool.name == tool_name:
-                        print("Debug: Matched tool:", tool.name)
-                        if not isinstance(tool_input, dict):
-                            print("Debug: Invalid tool_input type:", type(tool_input))
-                            combined_output.append(f"Error: Invalid tool input for {tool_name}")
-                        else:
-                            return AgentAction(tool=tool.name, tool_input=tool_input, log=f"Executor: Invoking {tool.name}")
-                print(f"Debug: Tool {tool_name} not found")
-                combined_output.append(f"Error: Tool {tool_name} not found")
+                tool_name = action_item.tool_name
+                tool_input = action_item.tool_input
+                logger.debug("Tool selection details - tool_name: %s tool_input: %s", tool_name, tool_input)
+                tool = self.tool_by_name.get(tool_name)
+                if tool is None:
+                    logger.debug("Tool %s not found", tool_name)
+                    combined_output.append(f"Error: Tool {tool_name} not found")
+                elif not isinstance(tool_input, dict):
+                    logger.debug("Invalid tool_input type: %s", type(tool_input))
+                    combined_output.append(f"Error: Invalid tool input for {tool_name}")
+                else:
+                    logger.debug("Matched tool: %s", tool.name)
+                    tool_calls.append((tool.name, tool_input))
             elif action == "resource":
-                resource_uri = action_item.get("resource_uri", "")
+                resource_uri = action_item.resource_uri
                 if not resource_uri:
-                    print("Debug: Missing resource_uri in action")
+                    logger.debug("Missing resource_uri in action")
                     combined_output.append("Error: No resource URI provided")
                 else:
-                    result = send_mcp_request("resources/read", {"uri": resource_uri})
-                    combined_output.append(result)
+                    pending_reads.append((len(combined_output), resource_uri))
+                    combined_output.append(None)
             else:
-                print("Debug: Invalid action in action_item:", action_item)
+                logger.debug("Invalid action in action_item: %s", action_item)
                 combined_output.append(f"Error: Invalid action {action}")
-        
-        if combined_output:
-            print("Debug: Returning combined output:", combined_output)
-            # Second LLM trip to format the output
-            formatter_prompt = f"{self.formatter_prompt}\nOutput: {json.dumps(combined_output)}"
-            print("Debug: Raw formatter prompt sent:", repr(formatter_prompt))
-            formatted_response = call_grok_3(formatter_prompt)
-            print("Debug: Formatted Grok 3 response:", json.dumps(formatted_response, indent=2))
-            if isinstance(formatted_response, dict) and "tools" in formatted_response and "resources" in formatted_response:
-                # Convert formatted_response to JSON string to avoid ValidationError
-                formatted_output = json.dumps(formatted_response)
-                return AgentFinish(return_values={"output": formatted_output}, log="Executor: Returning formatted results")
+
+        if pending_reads:
+            results = await read_mcp_resources([uri for _, uri in pending_reads])
+            for (index, _), result in zip(pending_reads, results):
+                combined_output[index] = result
+
+        if tool_calls:
+            return [
+                MCPToolAction(tool=name, tool_input=tool_input, log=f"Executor: Invoking {name}", carried_output=combined_output if i == 0 else [])
+                for i, (name, tool_input) in enumerate(tool_calls)
+            ]
+
+        # List-only answers are built from already-known data, so the planner's formatted_output can be used as is
+        formatted_output = grok_response.get("formatted_output")
+        if combined_output and all(item.action == "list" for item in actions) and is_formatted_response(formatted_output):
+            logger.debug("Using planner formatted_output, skipping formatter call")
+            return AgentFinish(return_values={"output": to_json(formatted_output)}, log="Executor: Returning formatted results")
+
+        if not combined_output:
+            logger.debug("No valid action in grok_response: %s", grok_response)
+        return await self._complete(combined_output)
+
+    def _formatter_input(self, combined_output):
+        # Second LLM trip to format the output
+        formatter_prompt = f"{self.formatter_prompt}\nOutput: {to_json(combined_output)}"
+        logger.debug("Returning combined output: %s", combined_output)
+        logger.debug("Raw formatter prompt sent: %r", formatter_prompt)
+        return formatter_prompt
+
+    def _finish(self, combined_output, formatted_response):
+        logger.debug("Formatted Grok 3 response: %s", formatted_response)
+        if is_formatted_response(formatted_response):
+            # Convert formatted_response to JSON string to avoid ValidationError
+            formatted_output = to_json(formatted_response)
+            return AgentFinish(return_values={"output": formatted_output}, log="Executor: Returning formatted results")
+        logger.debug("Invalid formatted response: %s", formatted_response)
+        return AgentFinish(return_values={"output": to_json(combined_output)}, log="Executor: Returning unformatted results due to invalid format")
+
+# Discovered primitives, materialized once from the raw JSON-RPC dicts for attribute access downstream
+@dataclass(frozen=True, slots=True)
+class ToolSpec:
+    name: str
+    description: str
+
+    @classmethod
+    def from_dict(cls, item):
+        return cls(name=item["name"], description=item.get("description", ""))
+
+@dataclass(frozen=True, slots=True)
+class ResourceSpec:
+    uri: str
+    description: str
+
+    @classmethod
+    def from_dict(cls, item):
+        return cls(uri=item["uri"], description=item.get("description", ""))
+
+@dataclass(frozen=True, slots=True)
+class PromptSpec:
+    name: str
+    description: str
+
+    @classmethod
+    def from_dict(cls, item):
+        return cls(name=item["name"], description=item.get("description", ""))
+
+# Discovery results are cached per server in-process and on disk, since they rarely change within a session
+DISCOVERY_TTL_SECONDS = float(os.getenv("DISCOVERY_TTL_SECONDS", "300"))
+DISCOVERY_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "mcp_agent", "primitives.json")
+DISCOVERY_KINDS = ("tools", "resources", "prompts")
+_discovery_cache = {}
+_discovery_cache_lock = threading.Lock()
+
+def _read_discovery_cache_file():
+    try:
+        with open(DISCOVERY_CACHE_FILE, 'rb') as f:
+            return orjson.loads(f.read())
+    except (OSError, ValueError):
+        return {}
+
+# Per-server cache entries hold each kind separately: {kind: {"checked_at", "items", "failed"}}
+def _cached_kinds(entries, server_url):
+    entry = entries.get(server_url)
+    return entry if isinstance(entry, dict) else {}
+
+# A kind whose last fetch failed is stale regardless of age, so startup re-fetches it; allow_failed accepts
+# its last known items instead, for the fallback used when the server is unreachable
+def load_cached_primitives(server_url, max_age=DISCOVERY_TTL_SECONDS, allow_failed=False):
+    kinds = _cached_kinds(_read_discovery_cache_file(), server_url)
+    now = time.time()
+    for kind in DISCOVERY_KINDS:
+        cached = kinds.get(kind)
+        if not isinstance(cached, dict) or now - cached.get("checked_at", 0) >= max_age:
+            return None
+        if cached.get("failed") and not allow_failed:
+            return None
+    return {kind: kinds[kind].get("items", []) for kind in DISCOVERY_KINDS}
+
+# Merge a discovery into the cache: fetched kinds replace their items, failed kinds keep their last known
+# items and are flagged as failed. Returns the merged primitives now served in-process
+def save_cached_primitives(server_url, primitives, failed_kinds=()):
+    with _discovery_cache_lock:
+        entries = _read_discovery_cache_file()
+        previous = _cached_kinds(entries, server_url)
+        now = time.time()
+        merged = {}
+        for kind in DISCOVERY_KINDS:
+            if kind in failed_kinds:
+                last = previous.get(kind) if isinstance(previous.get(kind), dict) else {}
+                merged[kind] = {"checked_at": now, "items": last.get("items", []), "failed": True}
             else:
-                print("Debug: Invalid formatted response:", formatted_response)
-                return AgentFinish(return_values={"output": json.dumps(combined_output)}, log="Executor: Returning unformatted results due to invalid format")
-        
-        print("Debug: No valid action in grok_response:", grok_response)
-        return AgentFinish(return_values={"output": "No relevant tool or action found"}, log="Executor: No action taken")
+                merged[kind] = {"checked_at": now, "items": primitives[kind], "failed": False}
+        entries[server_url] = merged
+        result = {kind: merged[kind]["items"] for kind in DISCOVERY_KINDS}
+        _discovery_cache[server_url] = result
+        try:
+            os.makedirs(os.path.dirname(DISCOVERY_CACHE_FILE), exist_ok=True)
+            tmp_file = f"{DISCOVERY_CACHE_FILE}.{os.getpid()}.tmp"
+            with open(tmp_file, 'wb') as f:
+                f.write(orjson.dumps(entries))
+            os.replace(tmp_file, DISCOVERY_CACHE_FILE)
+        except OSError as e:
+            logger.debug("Could not write discovery cache: %s", e)
+        return result
 
-    async def aplan(self, intermediate_steps, **kwargs):
-        return self.plan(intermediate_steps, **kwargs)
+# Fetch primitives from the server; each kind that was fetched is cached, failed kinds are recorded as such.
+# Returns None only when the fetch failed outright (no list call succeeded)
+async def fetch_mcp_primitives(server_url):
+    # The three list calls are independent, so fan them out concurrently
+    results = await asyncio.gather(*(_send_mcp_async(f"{kind}/list", server_url=server_url) for kind in DISCOVERY_KINDS))
+    primitives = {kind: result.get(kind, []) for kind, result in zip(DISCOVERY_KINDS, results)}
+    failed_kinds = [kind for kind, result in zip(DISCOVERY_KINDS, results) if not result]
+    if failed_kinds:
+        logger.debug("MCP discovery failed for %s on %s", ", ".join(failed_kinds), server_url)
+    # Nothing came back at all: the server is unreachable, so leave the existing cache untouched
+    if len(failed_kinds) == len(DISCOVERY_KINDS):
+        return None
+    return save_cached_primitives(server_url, primitives, failed_kinds)
+
+def _refresh_primitives_in_background(server_url):
+    threading.Thread(target=lambda: asyncio.run(fetch_mcp_primitives(server_url)), daemon=True).start()
+
+# Shared handler behind every discovered MCP tool; bound per tool name with functools.partial
+def _invoke_mcp_tool(tool_name, input_dict):
+    logger.debug("MCP tool call - name: %s params: %s", tool_name, input_dict)
+    result = send_mcp_request("tools/call", {"name": tool_name, "params": input_dict})
+    logger.debug("MCP tool call response: %s", result)
+    return result
+
+# batch_tool: several MCP tools/call invocations in one JSON-RPC batch POST, falling back to single calls
+BATCH_TOOL_DESCRIPTION = (
+    "Run several independent tools in one round trip. "
+    "Input: {invocations: [{name: tool name, params: tool input dict}, ...]}. Returns one result per invocation, in order."
+)
+
+# Validate invocations against the discovered tool names. Returns the per-item results, pre-filled with
+# errors for invalid items (None where a call is pending), and the (slot, call) pairs to send
+def _batch_calls(invocations, known_tools):
+    results = []
+    pending = []
+    for inv in invocations if isinstance(invocations, list) else []:
+        name = inv.get("name") if isinstance(inv, dict) else None
+        params = inv.get("params", {}) if isinstance(inv, dict) else None
+        if not isinstance(name, str) or name not in known_tools:
+            results.append(f"Error: Tool {name} not found")
+        elif not isinstance(params, dict):
+            results.append(f"Error: Invalid tool input for {name}")
+        else:
+            pending.append((len(results), ("tools/call", {"name": name, "params": params})))
+            results.append(None)
+    return results, pending
+
+def _fill_batch_results(results, pending, call_results):
+    for (index, _), result in zip(pending, call_results):
+        results[index] = result
+    return results
+
+def invoke_mcp_batch(invocations, known_tools):
+    results, pending = _batch_calls(invocations, known_tools)
+    if not pending:
+        return results
+    calls = [call for _, call in pending]
+    call_results = send_mcp_batch(calls)
+    if call_results is None:
+        call_results = [send_mcp_request(method, params) for method, params in calls]
+    return _fill_batch_results(results, pending, call_results)
+
+async def ainvoke_mcp_batch(invocations, known_tools):
+    results, pending = _batch_calls(invocations, known_tools)
+    if not pending:
+        return results
+    calls = [call for _, call in pending]
+    call_results = await _run_io(send_mcp_batch, calls)
+    if call_results is None:
+        call_results = await asyncio.gather(*(_send_mcp_async(method, params) for method, params in calls))
+    return _fill_batch_results(results, pending, call_results)
+
+# The batch tool only dispatches to the discovered MCP tools, never to itself or unknown names
+def create_batch_tool(tool_names):
+    known_tools = frozenset(tool_names)
+
+    def batch_tool(invocations: List[Dict[str, Any]]):
+        return invoke_mcp_batch(invocations, known_tools)
+
+    async def abatch_tool(invocations: List[Dict[str, Any]]):
+        return await ainvoke_mcp_batch(invocations, known_tools)
+
+    return StructuredTool.from_function(func=batch_tool, coroutine=abatch_tool, name="batch_tool", description=BATCH_TOOL_DESCRIPTION)
 
 # Discover MCP primitives and create LangChain tools
-def discover_mcp_primitives(server_url=None):
-    tools_list = send_mcp_request("tools/list", server_url=server_url).get("tools", [])
-    resources_list = send_mcp_request("resources/list", server_url=server_url).get("resources", [])
-    prompts_list = send_mcp_request("prompts/list", server_url=server_url).get("prompts", [])
-
-    # Convert MCP tools to LangChain tools
-    def create_tool_handler(tool_name):
-        def tool_func(input_dict):
-            print("Debug: MCP tool call - name:", tool_name, "params:", json.dumps(input_dict, indent=2))
-            result = send_mcp_request("tools/call", {"name": tool_name, "params": input_dict})
-            print("Debug: MCP tool call response:", json.dumps(result, indent=2))
-            return result
-        return tool_func
+async def discover_mcp_primitives(server_url=None):
+    server_url = server_url or config["default_mcp_server"]
+    primitives = _discovery_cache.get(server_url)
+    if primitives is None:
+        primitives = load_cached_primitives(server_url)
+        if primitives is not None:
+            # Serve the warm cache now and refresh it so the next startup sees current data
+            logger.debug("Using cached MCP primitives for %s", server_url)
+            _discovery_cache[server_url] = primitives
+            _refresh_primitives_in_background(server_url)
+        else:
+            primitives = await fetch_mcp_primitives(server_url)
+            # Only an unreachable server falls back to the last known primitives, however old, so the agent stays
+            # usable; a partial discovery already kept the last known items for just the kinds that failed
+            if primitives is None:
+                primitives = load_cached_primitives(server_url, max_age=float("inf"), allow_failed=True)
+                if primitives is not None:
+                    logger.warning("MCP discovery failed for %s, using stale cached primitives", server_url)
+                else:
+                    primitives = {kind: [] for kind in DISCOVERY_KINDS}
+    tools_list = [ToolSpec.from_dict(tool) for tool in primitives["tools"]]
+    resources_list = [ResourceSpec.from_dict(res) for res in primitives["resources"]]
+    prompts_list = [PromptSpec.from_dict(prompt) for prompt in primitives["prompts"]]
 
+    # Convert MCP tools to LangChain tools bound to the shared sender
     tools = [
         Tool(
-            name=tool["name"],
-            func=create_tool_handler(tool["name"]),
-            description=tool["description"]
+            name=tool.name,
+            func=functools.partial(_invoke_mcp_tool, tool.name),
+            description=tool.description
         )
         for tool in tools_list
     ]
-    print("Debug: Discovered tools:", [t.name for t in tools])
-    print("Debug: Discovered resources:", [r["uri"] for r in resources_list])
-    print("Debug: Discovered prompts:", [p["name"] for p in prompts_list])
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Discovered tools: %s", ", ".join(t.name for t in tools))
+        logger.debug("Discovered resources: %s", ", ".join(r.uri for r in resources_list))
+        logger.debug("Discovered prompts: %s", ", ".join(p.name for p in prompts_list))
     return tools, resources_list, prompts_list
 
+# Speculative discovery, started by the script entry point before main(). It cannot start earlier, since the
+# module must finish defining discovery first, so only event-loop startup overlaps it; create_agents awaits the
+# shared future (so discovery runs once per process) for at most DISCOVERY_TIMEOUT seconds
+DISCOVERY_TIMEOUT = float(os.getenv("DISCOVERY_TIMEOUT", "30"))
+_discovery_future = None
+_discovery_future_lock = threading.Lock()
+
+def _warm_discovery(future, server_url):
+    try:
+        future.set_result(asyncio.run(discover_mcp_primitives(server_url)))
+    except Exception as e:
+        future.set_exception(e)
+
+def start_discovery_warmup(server_url=None):
+    global _discovery_future
+    with _discovery_future_lock:
+        if _discovery_future is None:
+            _discovery_future = Future()
+            # A dedicated thread rather than _EXEC, since discovery itself waits on _EXEC workers
+            threading.Thread(target=_warm_discovery, args=(_discovery_future, server_url), daemon=True).start()
+        return _discovery_future
+
 # Create LangChain agent
-def create_agents():
-    tools, resources_list, prompts_list = discover_mcp_primitives()
-    print("Debug: Agent initialized with model:", config["default_model"], "API key set:", bool(config["xai_api_key"]))
-    formatted_tools = "\n".join(f"- Name: {tool.name}, Description: {tool.description}" for tool in tools) if tools else "None available."
-    formatted_resources = "\n".join(f"- URI: {res['uri']}, Name: {res['name']}, Description: {res['description']}" for res in resources_list) if resources_list else "None available."
-    formatted_prompts = "\n".join(f"- Name: {prompt['name']}, Description: {prompt['description']}" for prompt in prompts_list) if prompts_list else "None available."
-    with open("config.json", 'r') as f:
-        config_data = json.load(f)
-    orchestrator_prompts = config_data.get("orchestrator_prompts", [])
-    formatter_prompts = config_data.get("formatter_prompts", [])
-    if not orchestrator_prompts:
+async def create_agents():
+    try:
+        # shield keeps a timeout from cancelling the shared future the warm-up thread will still resolve
+        tools, resources_list, prompts_list = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(start_discovery_warmup())), DISCOVERY_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise RuntimeError(f"MCP discovery did not finish within {DISCOVERY_TIMEOUT:g}s") from None
+    # batch_tool is offered to the planner and executor only; listings show the discovered server tools
+    planner_tools = [create_batch_tool(t.name for t in tools)] if tools else []
+    logger.debug("Agent initialized with model: %s API key set: %s", config["default_model"], bool(config["xai_api_key"]))
+    instruction = config["instruction"]
+    formatter_prompt = config["formatter_prompt"]
+    if not instruction:
         raise ValueError("No orchestrator_prompts found in config.json")
-    if not formatter_prompts:
+    if not formatter_prompt:
         raise ValueError("No formatter_prompts found in config.json")
-    print("Debug: Raw orchestrator_prompts:", repr(orchestrator_prompts))
-    print("Debug: Raw formatter_prompts:", repr(formatter_prompts))
-    instruction = "\n".join(orchestrator_prompts)
-    formatter_prompt = "\n".join(formatter_prompts)
-    print("Debug: Raw instruction template created:", repr(instruction))
-    print("Debug: Raw formatter prompt created:", repr(formatter_prompt))
-    resources_list = [f"{res['uri']}: {res['description']}" for res in resources_list]
-    prompts_list = [f"{prompt['name']}: {prompt['description']}" for prompt in prompts_list]
-    memory = ConversationBufferWindowMemory(
+    logger.debug("Raw instruction template created: %r", instruction)
+    logger.debug("Raw formatter prompt created: %r", formatter_prompt)
+    # Structured entries are materialized once, as immutable tuples the executor renders and lists from directly
+    resources_list = tuple(map(asdict, resources_list))
+    prompts_list = tuple(map(asdict, prompts_list))
+    memory = CachedBufferWindowMemory(
         k=5,
         chat_memory=ChatMessageHistory(),
         return_messages=True,
@@ -303,34 +1053,39 @@ def create_agents():
             formatter_prompt=formatter_prompt,
             memory=memory,
             resources_list=resources_list,
-            prompts_list=prompts_list
+            prompts_list=prompts_list,
+            planner_tools=planner_tools
         ),
-        tools=tools,
+        tools=tools + planner_tools,
         memory=memory,
         verbose=True,
         return_intermediate_steps=True,
-        max_iterations=5
+        # One planning step plus the finishing step; aplan never re-plans within a turn
+        max_iterations=2
     )
     return mcp_executor, instruction
 
 # Orchestrator function to run interactive agent loop
-def main():
-    mcp_executor, instruction = create_agents()
+async def main():
+    mcp_executor, instruction = await create_agents()
     print("Enter a query for the MCP-agent Executor. Type 'exit' to quit.")
     while True:
-        query = input("mcp-agent > ")
-        print("Orchestrator: Received query:", query)
+        # Read stdin off the event loop so background tasks keep running while waiting for the user. This stays on the
+        # loop's default executor (asyncio.to_thread), not _EXEC, so a user idling at the prompt never holds an MCP/Grok I/O worker
+        query = await asyncio.to_thread(input, "mcp-agent > ")
+        logger.info("Orchestrator: Received query: %s", query)
         if query.lower() == "exit":
             break
         try:
-            print("Orchestrator: Delegating to Executor with memory:", mcp_executor.memory.buffer_as_str)
-            result = mcp_executor.invoke({"input": query})
-            print("Orchestrator: Formatting and returning result")
+            logger.info("Orchestrator: Delegating to Executor with memory: %s", mcp_executor.memory.cached_buffer)
+            result = await mcp_executor.ainvoke({"input": query})
+            logger.info("Orchestrator: Formatting and returning result")
             print("Result:", json.dumps(result["output"], indent=2))
             mcp_executor.memory.save_context({"input": query}, {"output": result["output"]})
         except Exception as e:
             print(f"Error processing query: {str(e)}")
-            print("Debug: Error details:", str(e), "Traceback:", traceback.format_exc())
+            logger.debug("Error details: %s", e, exc_info=True)
 
 if __name__ == "__main__":
-    main()
+    start_discovery_warmup()
+    asyncio.run(main())
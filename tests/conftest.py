@@ -0,0 +1,9 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# mcp_agent validates the API key and reads config.json from the working directory at import time
+os.environ.setdefault("XAI_API_KEY", "test-key")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
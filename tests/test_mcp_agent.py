@@ -0,0 +1,129 @@
+import asyncio
+import importlib
+import json
+
+import pytest
+
+from conftest import ROOT
+
+LIST_RESULTS = {
+    "tools/list": {"tools": [
+        {"name": "add_numbers", "description": "Adds two integers"},
+        {"name": "list_all_wells", "description": "Lists OSDU wells"}
+    ]},
+    "resources/list": {"resources": [{"uri": "osdu:wells", "description": "OSDU Well data"}]},
+    "prompts/list": {"prompts": []}
+}
+
+
+@pytest.fixture
+def agent_module(monkeypatch, tmp_path):
+    monkeypatch.chdir(ROOT)
+    module = importlib.import_module("mcp_agent")
+    monkeypatch.setattr(module, "DISCOVERY_CACHE_FILE", str(tmp_path / "primitives.json"))
+    monkeypatch.setattr(module, "_discovery_future", None)
+    monkeypatch.setattr(module, "_discovery_cache", {})
+    monkeypatch.setattr(module, "send_mcp_request", lambda method, params=None, server_url=None: LIST_RESULTS.get(method, {}))
+    return module
+
+
+def test_create_agents_builds_executor(agent_module):
+    executor, _ = asyncio.run(agent_module.create_agents())
+    agent = executor.agent
+    assert agent.tool_lines == ("add_numbers: Adds two integers", "list_all_wells: Lists OSDU wells")
+    assert "batch_tool" in agent.tool_by_name
+    assert "batch_tool" not in agent.list_outputs["tools"]
+    assert [t.name for t in executor.tools] == ["add_numbers", "list_all_wells", "batch_tool"]
+
+
+def test_list_answer_keeps_descriptions_with_separators(agent_module, monkeypatch):
+    results = {**LIST_RESULTS, "resources/list": {"resources": [{"uri": "osdu:wells", "description": "Wells: name: depth"}]},
+               "prompts/list": {"prompts": [{"name": "summarize", "description": "Summary: short"}]}}
+    monkeypatch.setattr(agent_module, "send_mcp_request", lambda method, params=None, server_url=None: results.get(method, {}))
+    agent = asyncio.run(agent_module.create_agents())[0].agent
+    assert agent.list_outputs["resources"] == ("osdu:wells: Wells: name: depth",)
+    answer = json.loads(agent._list_answer({"resources", "prompts"}).return_values["output"])
+    assert answer["resources"] == [{"uri": "osdu:wells", "description": "Wells: name: depth"}]
+    assert answer["prompts"] == [{"name": "summarize", "description": "Summary: short"}]
+
+
+class FakeResponse:
+    def __init__(self, lines, content_type="text/event-stream", status_code=200):
+        self.headers = {"Content-Type": content_type}
+        self.status_code = status_code
+        self.lines = lines
+        self.text = ""
+
+    def iter_lines(self):
+        return iter(self.lines)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+def test_parse_mcp_response_skips_notifications(agent_module):
+    response = FakeResponse([
+        b"event: message",
+        b'data: {"jsonrpc": "2.0", "method": "notifications/progress", "params": {"progress": 1}}',
+        b"",
+        b'data: {"jsonrpc": "2.0", "id": 7, "result": {"content": "done"}}'
+    ])
+    assert agent_module.parse_mcp_response(response, 7) == {"jsonrpc": "2.0", "id": 7, "result": {"content": "done"}}
+    assert agent_module.parse_mcp_response(FakeResponse([b'data: {"jsonrpc": "2.0", "method": "notifications/message"}']), 7) is None
+
+
+class FakeSession:
+    def __init__(self, response):
+        self.response = response
+        self.posts = 0
+
+    def post(self, *args, **kwargs):
+        self.posts += 1
+        return self.response
+
+
+def test_batch_over_sse_is_not_replayed(agent_module, monkeypatch):
+    # Streamable HTTP servers may answer a batch with one SSE event per reply
+    session = FakeSession(FakeResponse([
+        b'data: {"jsonrpc": "2.0", "method": "notifications/progress", "params": {}}',
+        b'data: {"jsonrpc": "2.0", "id": 1, "result": {"sum": 3}}',
+        b'data: {"jsonrpc": "2.0", "id": 0, "result": {"wells": []}}'
+    ]))
+    single_calls = []
+    monkeypatch.setattr(agent_module, "_mcp_session_for", lambda methods: session)
+    monkeypatch.setattr(agent_module, "send_mcp_request", lambda *args, **kwargs: single_calls.append(args) or {})
+    results = agent_module.invoke_mcp_batch(
+        [{"name": "list_all_wells", "params": {}}, {"name": "add_numbers", "params": {"a": 1, "b": 2}}, {"name": "unknown"}],
+        frozenset(["list_all_wells", "add_numbers"])
+    )
+    assert results == [{"wells": []}, {"sum": 3}, "Error: Tool unknown not found"]
+    assert session.posts == 1
+    assert single_calls == []
+
+
+def test_retry_after_is_capped_by_backoff_max(agent_module):
+    class Reply:
+        headers = {"Retry-After": "60"}
+
+    retry = agent_module._grok_session.get_adapter("https://api.x.ai").max_retries
+    assert isinstance(retry, agent_module.CappedRetry)
+    assert retry.get_retry_after(Reply()) == retry.backoff_max == 4.0
+    assert retry.new(total=1).get_retry_after(Reply()) == 4.0
+
+
+def test_failed_kinds_are_not_served_as_fresh(agent_module):
+    server = "http://mcp.test/"
+    primitives = {"tools": [{"name": "add_numbers", "description": "Adds"}], "resources": [], "prompts": []}
+    agent_module.save_cached_primitives(server, primitives)
+    assert agent_module.load_cached_primitives(server) == primitives
+    agent_module.save_cached_primitives(server, {**primitives, "tools": []}, failed_kinds=["prompts"])
+    assert agent_module.load_cached_primitives(server) is None
+    assert agent_module.load_cached_primitives(server, max_age=float("inf"), allow_failed=True)["tools"] == []
+
+
+@pytest.mark.parametrize("value, expected", [("debug", "DEBUG"), (" Warning ", "WARNING"), ("verbose", "INFO"), (None, "INFO")])
+def test_log_level_is_case_insensitive(agent_module, value, expected):
+    assert agent_module.resolve_log_level(value, "INFO") == expected